@@ -7,6 +7,13 @@ import requests
 from dots_ocr.utils.image_utils import PILimage_to_base64
 from openai import OpenAI
 import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _get_client(base_url, api_key):
+    # reuse one client per server so pages share its pooled keep-alive connections
+    return OpenAI(api_key=api_key, base_url=base_url)
 
 
 def inference_with_vllm(
@@ -21,7 +28,7 @@ def inference_with_vllm(
         ):
     
     addr = f"http://{ip}:{port}/v1"
-    client = OpenAI(api_key="{}".format(os.environ.get("API_KEY", "0")), base_url=addr)
+    client = _get_client(addr, "{}".format(os.environ.get("API_KEY", "0")))
     messages = []
     messages.append(
         {
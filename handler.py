@@ -6,9 +6,9 @@ import json
 import base64
 from PIL import Image
 import io
-import torch
-from transformers import AutoModel, AutoTokenizer
 import logging
+import queue
+import threading
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,26 +16,49 @@ logger = logging.getLogger(__name__)
 # Global model variables
 model = None
 tokenizer = None
+_load_lock = threading.Lock()
 
 def load_model():
     """Load the OCR model"""
     global model, tokenizer
     
-    if model is None:
+    # Fast path: skip the lock once the model is in place
+    if model is not None:
+        return True
+    
+    with _load_lock:
+        # Another request may have finished loading while we waited
+        if model is not None:
+            return True
+        
+        try:
+            # Heavy imports live here so echo/test jobs don't pay for them at worker boot
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+        except ImportError as e:
+            logger.error(f"Failed to import model dependencies: {str(e)}")
+            return False
+        
         try:
             logger.info("Loading OCR model...")
             # Using GOT-OCR2.0 which is excellent for documents
             model_name = "ucaslcl/GOT-OCR2_0"
             
-            tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-            model = AutoModel.from_pretrained(
+            # Finish setup on locals, then publish model last: the lock-free
+            # fast path only checks model
+            got_tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+            got_model = AutoModel.from_pretrained(
                 model_name,
                 trust_remote_code=True,
                 device_map='cuda' if torch.cuda.is_available() else 'cpu',
                 torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
                 low_cpu_mem_usage=True
             )
-            model.eval()
+            if torch.cuda.is_available():
+                torch.backends.cuda.matmul.allow_tf32 = True
+            got_model.eval()
+            tokenizer = got_tokenizer
+            model = got_model
             logger.info("Model loaded successfully!")
             return True
         except Exception as e:
@@ -46,50 +69,86 @@ def load_model():
                 from transformers import TrOCRProcessor, VisionEncoderDecoderModel
                 
                 processor = TrOCRProcessor.from_pretrained("microsoft/trocr-base-printed")
-                model = VisionEncoderDecoderModel.from_pretrained("microsoft/trocr-base-printed")
+                trocr_model = VisionEncoderDecoderModel.from_pretrained("microsoft/trocr-base-printed")
+                trocr_model.eval()
                 tokenizer = processor
+                model = trocr_model
                 logger.info("TrOCR model loaded as fallback")
                 return True
             except Exception as e2:
                 logger.error(f"Fallback model also failed: {str(e2)}")
                 return False
-    return True
 
 def process_pdf(pdf_bytes):
-    """Process PDF document"""
+    """Process PDF document, returning (text, page_count)"""
     try:
         import fitz  # PyMuPDF
         
         # Open PDF from bytes
         pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
         
+        page_count = pdf_document.page_count
+        
+        # Rasterize on a background thread so page N+1 renders while page N is OCR'd
+        pages = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        
+        def render_pages():
+            try:
+                for page_num in range(page_count):
+                    if stop.is_set():
+                        return
+                    page = pdf_document[page_num]
+                    
+                    # Method 1: Direct text extraction
+                    text = page.get_text()
+                    
+                    # Method 2: OCR on page image if no text
+                    image = None
+                    if model and (not text.strip() or len(text.strip()) < 50):
+                        # Convert page to image straight from the raw samples, no PNG round-trip
+                        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)  # 2x scale for better OCR
+                        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                    pages.put((page_num, text, image))
+                pages.put(None)
+            except Exception as e:
+                pages.put(e)
+        
+        renderer = threading.Thread(target=render_pages, daemon=True)
+        renderer.start()
+        
         all_text = []
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document[page_num]
-            
-            # Method 1: Direct text extraction
-            text = page.get_text()
-            if text.strip():
-                all_text.append(f"Page {page_num + 1} (Text Layer):\n{text}")
-            
-            # Method 2: OCR on page image if no text
-            if not text.strip() or len(text.strip()) < 50:
-                # Convert page to image
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x scale for better OCR
-                img_data = pix.tobytes("png")
-                image = Image.open(io.BytesIO(img_data))
+        try:
+            while True:
+                item = pages.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                page_num, text, image = item
+                
+                if text.strip():
+                    all_text.append(f"Page {page_num + 1} (Text Layer):\n{text}")
                 
                 # OCR the image
-                if model:
+                if image is not None:
                     ocr_text = process_image_with_model(image)
                     all_text.append(f"Page {page_num + 1} (OCR):\n{ocr_text}")
+        finally:
+            # Unblock and wait for the renderer before closing the document under it
+            stop.set()
+            while renderer.is_alive():
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            pdf_document.close()
         
-        pdf_document.close()
-        return "\n\n".join(all_text)
+        return "\n\n".join(all_text), page_count
         
     except Exception as e:
         logger.error(f"PDF processing error: {str(e)}")
-        return f"Error processing PDF: {str(e)}"
+        return f"Error processing PDF: {str(e)}", 0
 
 def process_image_with_model(image):
     """Process image with the loaded model"""
@@ -97,23 +156,25 @@ def process_image_with_model(image):
         if model is None:
             return "Model not loaded"
         
-        # Save image temporarily (some models need file path)
-        temp_path = "/tmp/temp_image.png"
-        image.save(temp_path)
-        
-        # Try GOT-OCR style processing
-        if hasattr(model, 'chat'):
-            result = model.chat(tokenizer, temp_path, ocr_type='ocr')
-        # Try TrOCR style processing
-        elif hasattr(tokenizer, 'processor'):
-            pixel_values = tokenizer(image, return_tensors="pt").pixel_values
-            generated_ids = model.generate(pixel_values)
-            result = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        else:
-            # Generic transformers approach
-            inputs = tokenizer(images=image, return_tensors="pt")
-            outputs = model.generate(**inputs)
-            result = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        import torch  # already loaded by load_model
+        
+        # inference_mode skips autograd and view tracking entirely
+        with torch.inference_mode():
+            # Try GOT-OCR style processing
+            if hasattr(model, 'chat'):
+                # gradio_input=True lets chat() take the PIL image directly, no temp file;
+                # convert to RGB as its load_image() would
+                result = model.chat(tokenizer, image.convert('RGB'), ocr_type='ocr', gradio_input=True)
+            # Try TrOCR style processing
+            elif hasattr(tokenizer, 'processor'):
+                pixel_values = tokenizer(image, return_tensors="pt").pixel_values.to(model.device)
+                generated_ids = model.generate(pixel_values)
+                result = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
+            else:
+                # Generic transformers approach
+                inputs = tokenizer(images=image, return_tensors="pt").to(model.device)
+                outputs = model.generate(**inputs)
+                result = tokenizer.decode(outputs[0], skip_special_tokens=True)
         
         return result
         
@@ -150,13 +211,13 @@ def handler(job):
             logger.info("Processing PDF document...")
             try:
                 pdf_bytes = base64.b64decode(job_input["pdf"])
-                result = process_pdf(pdf_bytes)
+                result, page_count = process_pdf(pdf_bytes)
                 
                 return {
                     "output": {
                         "type": "pdf",
                         "text": result,
-                        "pages": result.count("Page "),
+                        "pages": page_count,
                         "model_used": "GOT-OCR2" if model_loaded else "PyMuPDF text extraction"
                     }
                 }